@@ -5,10 +5,17 @@ AddReference("QuantConnect.Algorithm.Framework")
 from QuantConnect import Resolution, Extensions
 from QuantConnect.Algorithm.Framework.Alphas import *
 from QuantConnect.Algorithm.Framework.Portfolio import *
-from itertools import groupby
-from datetime import datetime, timedelta
-from pytz import utc
-UTCMIN = datetime.min.replace(tzinfo=utc)
+
+import numpy as np
+
+# times are stored as POSIX timestamps (floats) so the per-tick checks are plain float comparisons
+TIMEMIN = float('-inf')
+
+# bind insight directions and PortfolioTarget.Percent once to avoid repeated attribute lookups on .NET types
+_UP = InsightDirection.Up
+_DOWN = InsightDirection.Down
+_FLAT = InsightDirection.Flat
+_pct = PortfolioTarget.Percent
 
 class CustomEqualWeightingPortfolioConstructionModel(PortfolioConstructionModel):
     
@@ -33,16 +40,15 @@ class CustomEqualWeightingPortfolioConstructionModel(PortfolioConstructionModel)
         '''
         
         self.insightCollection = InsightCollection()
-        self.removedSymbols = []
-        self.nextExpiryTime = UTCMIN
-        self.rebalancingTime = UTCMIN
+        self.removedSymbols = None
+        self.nextExpiryTime = TIMEMIN
+        self.rebalancingTime = TIMEMIN
         
         # if the rebalancing parameter is not False but a positive integer
-        # convert rebalancingParam to timedelta and create rebalancingFunc
+        # convert rebalancingParam to seconds
         if rebalancingParam > 0:
             self.rebalancing = True
-            rebalancingParam = timedelta(days = rebalancingParam)
-            self.rebalancingFunc = lambda dt: dt + rebalancingParam
+            self.rebalancingSeconds = float(rebalancingParam * 86400)
         else:
             self.rebalancing = rebalancingParam
 
@@ -58,64 +64,68 @@ class CustomEqualWeightingPortfolioConstructionModel(PortfolioConstructionModel)
             An enumerable of portfolio targets to be sent to the execution model
         '''
 
-        targets = []
+        utcTime = algorithm.UtcTime.timestamp()
         
         # check if we have new insights coming from the alpha model or if some existing insights have expired
         # or if we have removed symbols from the universe
-        if (len(insights) == 0 and algorithm.UtcTime <= self.nextExpiryTime and self.removedSymbols is None):
-            return targets
+        if (len(insights) == 0 and utcTime <= self.nextExpiryTime and not self.removedSymbols):
+            return []
         
         # here we get the new insights and add them to our insight collection
         for insight in insights:
             self.insightCollection.Add(insight)
             
         # create flatten target for each security that was removed from the universe
-        if self.removedSymbols is not None:
-            universeDeselectionTargets = [ PortfolioTarget(symbol, 0) for symbol in self.removedSymbols ]
-            targets.extend(universeDeselectionTargets)
-            self.removedSymbols = None
+        universeDeselectionTargets = [ PortfolioTarget(symbol, 0) for symbol in (self.removedSymbols or ()) ]
+        self.removedSymbols = None
 
         # get insight that haven't expired of each symbol that is still in the universe
         activeInsights = self.insightCollection.GetActiveInsights(algorithm.UtcTime)
 
         # get the last generated active insight for each symbol
-        lastActiveInsights = []
-        for symbol, g in groupby(activeInsights, lambda x: x.Symbol):
-            lastActiveInsights.append(sorted(g, key = lambda x: x.GeneratedTimeUtc)[-1])
-
-        errorSymbols = {}
+        # (single pass keeping the latest insight per symbol, no need for activeInsights to be sorted by symbol)
+        # and track the next expiry time of the active insights in the same pass
+        latestInsights = {}
+        nextExpiryTime = None
+        for insight in activeInsights:
+            current = latestInsights.get(insight.Symbol)
+            if current is None or insight.GeneratedTimeUtc > current.GeneratedTimeUtc:
+                latestInsights[insight.Symbol] = insight
+            closeTime = insight.CloseTimeUtc
+            if nextExpiryTime is None or closeTime < nextExpiryTime:
+                nextExpiryTime = closeTime
+        lastActiveInsights = list(latestInsights.values())
+
+        activeTargets = []
+        errorSymbols = set()
         # check if we actually want to create new targets for the securities (check function ShouldCreateTargets for details)
         if self.ShouldCreateTargets(algorithm, lastActiveInsights):
             # determine target percent for the given insights (check function DetermineTargetPercent for details)
             percents = self.DetermineTargetPercent(lastActiveInsights)
-            for insight in lastActiveInsights:
-                target = PortfolioTarget.Percent(algorithm, insight.Symbol, percents[insight])
-                if not target is None:
-                    targets.append(target)
-                else:
-                    errorSymbols[insight.Symbol] = insight.Symbol
+            insightTargets = [(insight, _pct(algorithm, insight.Symbol, percent)) for insight, percent in zip(lastActiveInsights, percents)]
+            activeTargets = [target for _, target in insightTargets if target is not None]
+            # keep track of the symbols we could not create a target for
+            errorSymbols = {insight.Symbol for insight, target in insightTargets if target is None}
                     
             # update rebalancing time
             if self.rebalancing:
-                self.rebalancingTime = self.rebalancingFunc(algorithm.UtcTime)
+                self.rebalancingTime = utcTime + self.rebalancingSeconds
 
         # get expired insights and create flatten targets for each symbol
         expiredInsights = self.insightCollection.RemoveExpiredInsights(algorithm.UtcTime)
 
-        expiredTargets = []
-        for symbol, f in groupby(expiredInsights, lambda x: x.Symbol):
-            if not self.insightCollection.HasActiveInsights(symbol, algorithm.UtcTime) and not symbol in errorSymbols:
-                expiredTargets.append(PortfolioTarget(symbol, 0))
-                continue
+        expiredSymbols = {x.Symbol for x in expiredInsights}
 
-        targets.extend(expiredTargets)
-        
-        # here we update the next expiry date in the insight collection
-        self.nextExpiryTime = self.insightCollection.GetNextExpiryTime()
-        if self.nextExpiryTime is None:
-            self.nextExpiryTime = UTCMIN
+        # symbols in latestInsights still have active insights, no need to query the insight collection again
+        expiredTargets = [ PortfolioTarget(symbol, 0) for symbol in expiredSymbols
+                            if symbol not in latestInsights and symbol not in errorSymbols ]
 
-        return targets
+        # here we update the next expiry date with the one tracked above
+        # (after removing the expired insights, the collection only holds the active ones)
+        self.nextExpiryTime = TIMEMIN if nextExpiryTime is None else nextExpiryTime.timestamp()
+
+        # concatenate all the targets once
+        return universeDeselectionTargets + activeTargets + expiredTargets
 
     def ShouldCreateTargets(self, algorithm, lastActiveInsights):
         
@@ -130,21 +140,23 @@ class CustomEqualWeightingPortfolioConstructionModel(PortfolioConstructionModel)
         '''
         
         # it is time to rebalance
-        if self.rebalancing and algorithm.UtcTime >= self.rebalancingTime:
+        if self.rebalancing and algorithm.UtcTime.timestamp() >= self.rebalancingTime:
             return True
         
+        portfolio = algorithm.Portfolio
         for insight in lastActiveInsights:
+            # get the holding and direction only once per insight
+            holding = portfolio[insight.Symbol]
+            direction = insight.Direction
             # if there is an insight for a new security that's not invested, then rebalance
-            if not algorithm.Portfolio[insight.Symbol].Invested and insight.Direction != InsightDirection.Flat:
+            if not holding.Invested and direction != _FLAT:
                 return True
             # if there is an insight to close a long position, then rebalance
-            elif algorithm.Portfolio[insight.Symbol].IsLong and insight.Direction != InsightDirection.Up:
+            elif holding.IsLong and direction != _UP:
                 return True
             # if there is an insight to close a short position, then rebalance
-            elif algorithm.Portfolio[insight.Symbol].IsShort and insight.Direction != InsightDirection.Down:
+            elif holding.IsShort and direction != _DOWN:
                 return True
-            else:
-                continue
             
         return False
         
@@ -155,18 +167,19 @@ class CustomEqualWeightingPortfolioConstructionModel(PortfolioConstructionModel)
             Determine the target percent from each insight
         Args:
             lastActiveInsights: The active insights to generate a target from
+        Returns:
+            A list with the target percent for each insight, aligned with lastActiveInsights
         '''
             
-        result = {}
+        # read each insight direction only once into an array (Up = 1, Flat = 0, Down = -1)
+        directions = np.fromiter((int(insight.Direction) for insight in lastActiveInsights), dtype = np.int8, count = len(lastActiveInsights))
 
         # give equal weighting to each security
-        count = sum(x.Direction != InsightDirection.Flat for x in lastActiveInsights)
+        count = int(np.count_nonzero(directions))
         percent = 0 if count == 0 else 1.0 / count
         
-        for insight in lastActiveInsights:
-            result[insight] = insight.Direction * percent
-            
-        return result
+        # return python floats so they can be passed straight to PortfolioTarget.Percent
+        return (directions.astype(np.float64) * percent).tolist()
         
     def OnSecuritiesChanged(self, algorithm, changes):
         
@@ -179,5 +192,6 @@ class CustomEqualWeightingPortfolioConstructionModel(PortfolioConstructionModel)
         '''
 
         # get removed symbol and invalidate them in the insight collection
-        self.removedSymbols = [x.Symbol for x in changes.RemovedSecurities]
-        self.insightCollection.Clear(self.removedSymbols)
\ No newline at end of file
+        self.removedSymbols = {x.Symbol for x in changes.RemovedSecurities}
+        # Clear expects a Symbol[] so pass it a list
+        self.insightCollection.Clear(list(self.removedSymbols))
@@ -9,6 +9,31 @@ from Selection.FundamentalUniverseSelectionModel import FundamentalUniverseSelec
 
 import numpy as np
 
+def _select_low_pe(marketCaps, peRatios, marketCapLow, marketCapHigh, percentile):
+    
+    '''
+    Description:
+        Select the stocks with market cap between the given bounds, positive PE Ratio and PE Ratio in the given percentile
+    Args:
+        marketCaps: Array of market caps
+        peRatios: Array of PE Ratios aligned with marketCaps
+        marketCapLow/marketCapHigh: Exclusive market cap bounds
+        percentile: PE Ratio percentile (e.g. 1 for the 1st percentile)
+    Returns:
+        The number of stocks within the market cap bounds and the indices (into the input arrays) of the selected stocks
+    '''
+    
+    smallCapsIndex = np.nonzero((marketCaps > marketCapLow) & (marketCaps < marketCapHigh) & (peRatios > 0))[0]
+    if smallCapsIndex.size == 0:
+        return 0, smallCapsIndex
+    
+    # np.partition selects the k-th smallest value in linear time instead of sorting the whole array
+    smallCapsPERatios = peRatios[smallCapsIndex]
+    k = max(1, int(np.ceil(percentile / 100 * smallCapsPERatios.size)))
+    threshold = np.partition(smallCapsPERatios, k - 1)[k - 1]
+    
+    return smallCapsIndex.size, smallCapsIndex[smallCapsPERatios <= threshold]
+
 class SmallCapsLowPERatioUniverseSelectionModel(FundamentalUniverseSelectionModel):
     
     '''
@@ -40,10 +65,9 @@ class SmallCapsLowPERatioUniverseSelectionModel(FundamentalUniverseSelectionMode
         
         # securities must have fundamental data (to avoid ETFs)
         # securities must have last price above $5
-        filterCoarse = [x for x in coarse if x.HasFundamentalData and x.Price > 5]
-        algorithm.Log('stocks with fundamental data and price above 5: ' + str(len(filterCoarse)))
-        
-        coarseSelection = [x.Symbol for x in filterCoarse]
+        # (single pass keeping only the symbols, the coarse objects are not needed afterwards)
+        coarseSelection = [x.Symbol for x in coarse if x.HasFundamentalData and x.Price > 5]
+        algorithm.Log('stocks with fundamental data and price above 5: ' + str(len(coarseSelection)))
         
         # return coarseSelection symbols ready for fundamental data filtering below
         return coarseSelection
@@ -52,21 +76,22 @@ class SmallCapsLowPERatioUniverseSelectionModel(FundamentalUniverseSelectionMode
      
         ''' Fine selection based on fundamental data '''
         
-        # select small caps only (market cap between $300 million and $2 billion)
-        filterFine = [x for x in fine if 3e8 < x.MarketCap < 2e9 and x.ValuationRatios.PERatio > 0]
-        algorithm.Log('total number of small caps: ' + str(len(filterFine)))
+        # extract Market Cap and PE Ratio into arrays once so all the filtering below is done by numpy
+        fineList = list(fine)
+        marketCaps = np.fromiter((x.MarketCap for x in fineList), dtype = np.float64, count = len(fineList))
+        peRatios = np.fromiter((x.ValuationRatios.PERatio for x in fineList), dtype = np.float64, count = len(fineList))
         
-        # now calculate the PE Ratio 1st percentile
-        peRatios = [x.ValuationRatios.PERatio for x in filterFine]
-        lowestPERatioPercentile = np.percentile(peRatios, 1)
+        # select small caps only (market cap between $300 million and $2 billion) in the 1st PE Ratio percentile
+        smallCapsCount, lowestPERatioIndex = _select_low_pe(marketCaps, peRatios, 3e8, 2e9, 1)
+        algorithm.Log('total number of small caps: ' + str(smallCapsCount))
         
-        # filter stocks in the 1st PE Ratio percentile
-        lowestPERatio = list(filter(lambda x: x.ValuationRatios.PERatio <= lowestPERatioPercentile, filterFine))
+        lowestPERatio = [fineList[i] for i in lowestPERatioIndex]
         algorithm.Log('small caps in the 1st PE Ratio percentile: ' + str(len(lowestPERatio)))
         
-        for x in lowestPERatio:
-            algorithm.Log('stock: ' + str(x.Symbol.Value)
-            + ', current PE Ratio: ' + str(x.ValuationRatios.PERatio))
+        # log all the selected stocks in a single call
+        if lowestPERatio:
+            algorithm.Log('\n'.join(f'stock: {x.Symbol.Value}, current PE Ratio: {x.ValuationRatios.PERatio}'
+                                    for x in lowestPERatio))
         
         fineSelection = [x.Symbol for x in lowestPERatio]
          